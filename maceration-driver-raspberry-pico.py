@@ -1,4 +1,4 @@
-from machine import Pin, I2C, Timer, RTC
+from machine import Pin, I2C, RTC, lightsleep
 import oled_sh1106 as sh1106
 import ds18b20
 import onewire
@@ -9,9 +9,12 @@ RELAY_DURATION_MINUTES = 2
 MIXTURE_INTERVAL_HOURS = 1
 TEMP_UPDATE_INTERVAL_MINUTES = 1
 MACERATION_DURATION_DAYS = 1
+CONVERSION_POLL_ATTEMPTS = 10  # 10 ms apart
+TICK_MS = 1000
+TEMP_UPDATE_INTERVAL_MS = TEMP_UPDATE_INTERVAL_MINUTES * 60 * 1000
 
 # Initializing Display
-i2c_display = I2C(1, scl=Pin(3), sda=Pin(2), freq=100000)
+i2c_display = I2C(1, scl=Pin(3), sda=Pin(2), freq=400000)
 display = sh1106.SH1106_I2C(128, 64, i2c_display, None, addr=0x3c)
 display.rotate(True)
 display.fill(0)
@@ -25,10 +28,11 @@ utime.sleep_ms(100)  # Add a delay after initializing the display
 i2c = I2C(1)
 rtc = RTC()
 year, month, day, _, hours, minutes, seconds, _ = rtc.datetime()
+tod_seconds = hours * 3600 + minutes * 60 + seconds  # seconds since midnight
 
 # Initializing GPIO pins
 temperature_sensor_power_pin = Pin(17, Pin.OUT)
-temperature_sensor_power_pin.low()  # Turn off by default
+temperature_sensor_power_pin.high()  # Keep powered, the sensor idles at ~1 uA between conversions
 relay_pin = Pin(18, Pin.OUT)  
 relay_pin.low()  # Turn off by default
 
@@ -40,10 +44,16 @@ temp_sensor = ds18b20.DS18X20(ow)
 relay_active = False
 current_temperature = "Waiting for temp"
 relay_next_activation = MIXTURE_INTERVAL_HOURS * 3600  # in seconds
+sensor_roms = []
+display_dirty = True  # the whole screen has to be redrawn
+last_temp_text = None
+last_relay_active = None
 
 
 def display_error(message):
     """Displays error messages on the OLED screen."""
+    global display_dirty
+    display_dirty = True
     display.fill(0)
     display.text(message, 0, 30, 1)
     display.show()
@@ -51,9 +61,8 @@ def display_error(message):
 
 def format_seconds_to_hms(seconds):
     """Converts seconds to a formatted hour:minute:second string."""
-    h = seconds // 3600
-    m = (seconds % 3600) // 60
-    s = seconds % 60
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
     return f"{h:02}:{m:02}:{s:02}"
 
 
@@ -74,22 +83,14 @@ def deactivate_relay():
 
 
 def increment_time():
-    """Increments the time values."""
-    global hours, minutes, seconds
-    seconds += 1
-    if seconds >= 60:
-        seconds = 0
-        minutes += 1
-        if minutes >= 60:
-            minutes = 0
-            hours += 1
-            if hours >= 24:
-                hours = 0
+    """Increments the time of day."""
+    global tod_seconds
+    tod_seconds = (tod_seconds + 1) % 86400
 
 
 def update_display():
     """Updates the OLED screen with the current status."""
-    global relay_next_activation
+    global relay_next_activation, display_dirty, last_temp_text, last_relay_active
     
     increment_time()
     relay_next_activation -= 1
@@ -99,40 +100,72 @@ def update_display():
         else:
             activate_relay()
 
-    current_time = "{:02}:{:02}:{:02}".format(hours, minutes, seconds)
-    display.fill(0)
-    display.text(current_temperature, 0, 0, 1)
-    
-    if relay_active:
-        display.text(f'Mixing:', 0, 24, 1)
-        display.text(f'{format_seconds_to_hms(relay_next_activation)}', 65, 24, 1)
-    else:
-        display.text(f'Next:', 0, 24, 1)
-        display.text(f'{format_seconds_to_hms(relay_next_activation)}', 46, 24, 1)
-        
-    display.text(current_time, 65, 50, 1)
-    display.text(f'Day:{MACERATION_DURATION_DAYS}', 0, 50, 1)
+    if display_dirty:
+        display.fill(0)
+        display.text(f'Day:{MACERATION_DURATION_DAYS}', 0, 50, 1)
+        display_dirty = False
+        last_temp_text = None
+        last_relay_active = None
+
+    # Only the clock and the countdown change every second, the rest is redrawn on change
+    if current_temperature != last_temp_text:
+        display.fill_rect(0, 0, 128, 8, 0)
+        display.text(current_temperature, 0, 0, 1)
+        last_temp_text = current_temperature
+
+    if relay_active != last_relay_active:
+        display.fill_rect(0, 24, 128, 8, 0)
+        display.text('Mixing:' if relay_active else 'Next:', 0, 24, 1)
+        last_relay_active = relay_active
+
+    relay_time_x = 65 if relay_active else 46
+    display.fill_rect(relay_time_x, 24, 128 - relay_time_x, 8, 0)
+    display.text(format_seconds_to_hms(relay_next_activation), relay_time_x, 24, 1)
+
+    display.fill_rect(65, 50, 128 - 65, 8, 0)
+    display.text(format_seconds_to_hms(tod_seconds), 65, 50, 1)
     display.show()
 
 
-def measure_temperature():
-    """Measures the temperature using the DS18B20 sensor."""
-    global current_temperature
-    temperature_sensor_power_pin.high()
-    utime.sleep_ms(100)
-    roms = temp_sensor.scan()
-    if roms:
-        try:
+def kick_conversion():
+    """Starts a temperature conversion to be read by the next measurement."""
+    global sensor_roms, current_temperature
+    try:
+        sensor_roms = temp_sensor.scan()
+        if sensor_roms:
             temp_sensor.convert_temp()
-            utime.sleep_ms(750)
-            temp = temp_sensor.read_temp(roms[0])
-            current_temperature = 'Wine T = {:.1f} C'.format(temp)
-        except Exception:
-            display_error("Sensor Error")
-            current_temperature = 'Sensor Error'
-    else:
+    except Exception:
+        sensor_roms = []
+        display_error("Sensor Error")
+        current_temperature = 'Sensor Error'
+
+
+def read_completed_conversion():
+    """Reads the temperature converted since the previous measurement."""
+    global current_temperature
+    if not sensor_roms:
         current_temperature = 'No sensor'
-    temperature_sensor_power_pin.low()
+        return
+    try:
+        # The DS18B20 holds the bus low until the conversion is done
+        for _ in range(CONVERSION_POLL_ATTEMPTS):
+            if ow.readbit():
+                break
+            utime.sleep_ms(10)
+        else:
+            current_temperature = 'Sensor not ready'
+            return
+        temp = temp_sensor.read_temp(sensor_roms[0])
+        current_temperature = 'Wine T = {:.1f} C'.format(temp)
+    except Exception:
+        display_error("Sensor Error")
+        current_temperature = 'Sensor Error'
+
+
+def measure_temperature():
+    """Measures the temperature using the DS18B20 sensor."""
+    read_completed_conversion()
+    kick_conversion()
 
 
 def set_rtc_date_time(year, month, day, hour, minute, second):
@@ -146,11 +179,10 @@ if __name__ == "__main__":
     # Uncomment the below line only when you need to set the RTC date and time
     # set_rtc_date_time(2023, 9, 10, 09, 08, 0)
     
-    display_timer = Timer(-1)
-    display_timer.init(period=1000, mode=Timer.PERIODIC, callback=lambda t: update_display())
-    temp_measure_timer = Timer(-1)
-    temp_measure_timer.init(period=TEMP_UPDATE_INTERVAL_MINUTES * 60 * 1000, mode=Timer.PERIODIC, callback=lambda t: measure_temperature())
-    
+    kick_conversion()
+    next_tick_ms = utime.ticks_add(utime.ticks_ms(), TICK_MS)
+    next_temp_ms = utime.ticks_add(utime.ticks_ms(), TEMP_UPDATE_INTERVAL_MS)
+
     while True:
         if days_elapsed > MACERATION_DURATION_DAYS:
             display.fill(0)
@@ -158,10 +190,23 @@ if __name__ == "__main__":
             display.text('Completed!', 10, 30, 1)
             display.show()
             break
-        utime.sleep(1)
-        
-        _, _, current_day, _, _, _, _, _ = rtc.datetime()
-        if current_day != day:
-            day = current_day
-            days_elapsed += 1
 
+        now = utime.ticks_ms()
+        if utime.ticks_diff(now, next_tick_ms) >= 0:
+            update_display()
+            next_tick_ms = utime.ticks_add(next_tick_ms, TICK_MS)
+
+            _, _, current_day, _, _, _, _, _ = rtc.datetime()
+            if current_day != day:
+                day = current_day
+                days_elapsed += 1
+
+        if utime.ticks_diff(now, next_temp_ms) >= 0:
+            measure_temperature()
+            next_temp_ms = utime.ticks_add(next_temp_ms, TEMP_UPDATE_INTERVAL_MS)
+
+        # Sleep until the next deadline instead of waking on periodic timers
+        now = utime.ticks_ms()
+        sleep_ms = min(utime.ticks_diff(next_tick_ms, now), utime.ticks_diff(next_temp_ms, now))
+        if sleep_ms > 0:
+            lightsleep(sleep_ms)
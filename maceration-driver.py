@@ -1,16 +1,25 @@
+import os
+import sys
 import time
 import json
+import queue
 import logging
+import threading
 from RPLCD.i2c import CharLCD
+from smbus2 import SMBus, i2c_msg
 from gpiozero import OutputDevice
 from w1thermsensor import W1ThermSensor
-from datetime import datetime, timedelta
+from w1thermsensor.errors import W1ThermSensorError, SensorNotReadyError, ResetValueError
 from azure.iot.device import IoTHubDeviceClient
+from scheduler import Scheduler
 
 
 class AzureIoTConnect:
     """ Handles connection and message sending through Azure IoT Hub"""
 
+    MESSAGE_QUEUE_SIZE = 64
+    SHUTDOWN_TIMEOUT_SECONDS = 10
+
     def __init__(self, config_file):
         """
         Initialize Azure IoT connection.
@@ -18,6 +27,10 @@ class AzureIoTConnect:
         """
         self.connection_string = self.load_connection_string(config_file)
         self.client = self.initialize_client()
+        self.connect()
+        self.messages = queue.Queue(maxsize=self.MESSAGE_QUEUE_SIZE)
+        self.sender = threading.Thread(target=self.send_queued_messages, daemon=True)
+        self.sender.start()
 
     def load_connection_string(self, config_file):
         """
@@ -48,16 +61,62 @@ class AzureIoTConnect:
             logging.error("Failed to initialize Azure IoT client")
             raise e
 
+    def connect(self):
+        """
+        Connects the client up front so messages do not pay for connecting.
+        On failure the client connects again on the next send.
+        """
+        try:
+            self.client.connect()
+        except Exception:
+            logging.error("Failed to connect to Azure IoT Hub")
+
     def send_message(self, message):
         """
-        Sends message to Azure IoT Hub.
+        Queues message for sending to Azure IoT Hub without blocking.
+        The oldest queued message is dropped when the queue is full.
         :param message: Message to be sent.
         """
+        self.enqueue(json.dumps(message))
+
+    def enqueue(self, payload):
+        """
+        Puts payload on the send queue, dropping the oldest queued message when the queue is full.
+        :param payload: Serialized message, or None to stop the sender thread.
+        """
         try:
-            self.client.send_message(json.dumps(message))
-        except Exception as e:
-            logging.error("Failed to send message to Azure IoT Hub")
-            raise e
+            self.messages.put_nowait(payload)
+        except queue.Full:
+            logging.warning("Azure IoT Hub message queue full, dropping oldest message")
+            try:
+                self.messages.get_nowait()
+            except queue.Empty:
+                pass
+            self.messages.put_nowait(payload)
+
+    def send_queued_messages(self):
+        """
+        Sends queued messages to Azure IoT Hub until shutdown() is called.
+        """
+        while True:
+            payload = self.messages.get()
+            if payload is None:
+                return
+            try:
+                self.client.send_message(payload)
+            except Exception:
+                logging.error("Failed to send message to Azure IoT Hub")
+
+    def shutdown(self):
+        """
+        Sends the remaining queued messages and disconnects from Azure IoT Hub.
+        Waits at most SHUTDOWN_TIMEOUT_SECONDS, so an unreachable hub cannot keep the process alive.
+        """
+        self.enqueue(None)
+        self.sender.join(timeout=self.SHUTDOWN_TIMEOUT_SECONDS)
+        if self.sender.is_alive():
+            logging.error("Timed out sending queued messages to Azure IoT Hub")
+        self.client.shutdown()
 
     @property
     def is_connected(self):
@@ -71,31 +130,96 @@ class WineMacerator:
     """ Handles the process of wine maceration """
 
     LCD_I2C_ADDRESS = 0x27
+    LCD_I2C_PORT = 1
+    LCD_COLS = 16
+    LCD_BLANK_ROW = b' ' * LCD_COLS
+    LCD_INFO_WIDTH = 11
+    LCD_STATUS_COLUMN = 12
+    LCD_ROW_ADDRESSES = (0x00, 0x40)
+    # PCF8574 backpack pins: P0 = RS, P2 = E, P3 = backlight, P4-P7 = D4-D7
+    PCF8574_RS = 0x01
+    PCF8574_ENABLE = 0x04
+    PCF8574_BACKLIGHT = 0x08
+    TWO_DIGITS = [b'%02d' % i for i in range(60)]
+    INFO_FORMAT = b'T:%.1f D:%d'
+    BLEND_FORMAT = b'Blend: %d:%s'
+    NEXT_FORMAT = b'Next: %d:%s:%s'
+    BLEND_STARTED = b'Mieszanie: --:--'
+    AZURE_OK = b'OK-A'
+    AZURE_NO = b'NO-A'
     RELAY_DURATION_MINUTES = 2
     MIXTURE_INTERVAL_HOURS = 6
     TEMP_UPDATE_INTERVAL_MINUTES = 15
     MACERATION_DURATION_DAYS = 14
-
-    def __init__(self, config_file_path):
+    SENSOR_RESOLUTION_BITS = 9
+    SENSOR_ZERO_SCRATCHPAD = b'00 00 00 00 00 00 00 00 00'
+    SENSOR_RESET_VALUE = 85000
+    NS_PER_SECOND = 1_000_000_000
+    # Identyfikatory zdarzeń, kolejność rozstrzyga zdarzenia o tym samym czasie
+    EVENT_TEMP_UPDATE = 0
+    EVENT_RELAY_END = 1
+    EVENT_RELAY_START = 2
+    EVENT_SECOND_UPDATE = 3
+    EVENT_MACERATION_END = 4
+
+    def __init__(self, azure_iot):
         """
-        Initializes wine macerator with given config file.
-        :param config_file_path: Path to configuration file for Azure IoT.
+        Initializes wine macerator with given Azure IoT connection.
+        :param azure_iot: AzureIoTConnect used for telemetry.
         """
-        self.azure_iot = AzureIoTConnect(config_file_path)
+        self.azure_iot = azure_iot
         self.initialize_components()
         self.set_initial_times()
 
     def initialize_components(self):
-        self.lcd = CharLCD(i2c_expander='PCF8574', address=self.LCD_I2C_ADDRESS, port=1, cols=16, rows=2, dotsize=8)
+        self.lcd = CharLCD(i2c_expander='PCF8574', address=self.LCD_I2C_ADDRESS, port=self.LCD_I2C_PORT, cols=self.LCD_COLS, rows=2, dotsize=8)
+        self.lcd_bus = SMBus(self.LCD_I2C_PORT)
+        self.lcd_data_nibbles = [self.pack_nibbles(char, self.PCF8574_RS) for char in range(256)]
+        self.lcd_command_nibbles = [self.pack_nibbles(command, 0) for command in range(256)]
+        self.lcd_row_buffer = bytearray(self.LCD_BLANK_ROW)
+        self.lcd_row_cache = [bytearray(self.LCD_BLANK_ROW), bytearray(self.LCD_BLANK_ROW)]
+        self.lcd_info = b''
         self.sensor = W1ThermSensor()
+        self.set_sensor_resolution()
+        self.sensor_fd = os.open(self.sensor.sensorpath, os.O_RDONLY)
         self.relay = OutputDevice(26, active_high=False)
+        self.relay_active = False
+
+    def set_sensor_resolution(self):
+        # 9 bitów (0.5 °C) skraca konwersję z 750 ms do ~94 ms
+        try:
+            self.sensor.set_resolution(self.SENSOR_RESOLUTION_BITS, persist=False)
+        except W1ThermSensorError:
+            logging.warning("Failed to set temperature sensor resolution, using the default")
 
     def set_initial_times(self):
+        # Wszystkie czasy to znaczniki time.monotonic_ns() w nanosekundach
+        self.scheduler = Scheduler(self.EVENT_MACERATION_END + 1)
+        self.event_handlers = {
+            self.EVENT_TEMP_UPDATE: self.update_temperature,
+            self.EVENT_RELAY_END: self.deactivate_relay,
+            self.EVENT_RELAY_START: self.activate_relay,
+            self.EVENT_SECOND_UPDATE: self.update_relay_timer,
+        }
         self.relay_end_time = None
-        self.next_temp_update = datetime.now()
-        self.next_relay_activation = datetime.now()
-        self.next_second_update = datetime.now()
-        self.end_maceration_time = datetime.now() + timedelta(days=self.MACERATION_DURATION_DAYS)
+        self.next_temp_update = self.schedule(self.EVENT_TEMP_UPDATE, 0)
+        self.next_relay_activation = self.schedule(self.EVENT_RELAY_START, 0)
+        self.next_second_update = self.schedule(self.EVENT_SECOND_UPDATE, 0)
+        self.end_maceration_time = self.schedule(self.EVENT_MACERATION_END, self.MACERATION_DURATION_DAYS * 86400)
+
+    def schedule(self, event, delay):
+        """
+        Schedules an event.
+        :param event: One of the EVENT_* identifiers, also used as priority of simultaneous events.
+        :param delay: Seconds from now until the event is due.
+        :return: time.monotonic_ns() value at which the event is due.
+        """
+        deadline = time.monotonic_ns() + delay * self.NS_PER_SECOND
+        self.scheduler.schedule(event, deadline)
+        return deadline
+
+    def sleep_ns(self, delay):
+        time.sleep(delay / self.NS_PER_SECOND)
 
     def update_temperature(self):
         self.set_next_temp_update_time()
@@ -104,79 +228,145 @@ class WineMacerator:
         self.azure_iot.send_message({"wine_temp": temperature})
 
     def set_next_temp_update_time(self):
-        self.next_temp_update = datetime.now() + timedelta(minutes=self.TEMP_UPDATE_INTERVAL_MINUTES)
+        self.next_temp_update = self.schedule(self.EVENT_TEMP_UPDATE, self.TEMP_UPDATE_INTERVAL_MINUTES * 60)
 
     def get_temperature_from_sensor(self):
-        return self.sensor.get_temperature()
+        # Każdy odczyt w1_slave wyzwala konwersję, druga linia kończy się na "t=<mili °C>"
+        data = os.pread(self.sensor_fd, 128, 0)
+        first_line = data[:data.find(b'\n')]
+        # Zerowy scratchpad ma poprawne CRC, więc samo "YES" nie wystarcza
+        if b'YES' not in first_line or self.SENSOR_ZERO_SCRATCHPAD in first_line:
+            raise SensorNotReadyError(self.sensor)
+        start = data.find(b't=') + 2
+        temperature = int(data[start:data.find(b'\n', start)])
+        # 85 °C to wartość po włączeniu zasilania, a nie pomiar
+        if temperature == self.SENSOR_RESET_VALUE:
+            raise ResetValueError(self.sensor.id)
+        return temperature / 1000
 
     def display_info_on_lcd(self, temperature):
-        remaining_days = (self.end_maceration_time - datetime.now()).days
-        self.lcd.cursor_pos = (0, 0)
-        self.lcd.write_string(f'T:{temperature:.1f} D:{remaining_days}'.ljust(11))
+        remaining_days = (self.end_maceration_time - time.monotonic_ns()) // (86400 * self.NS_PER_SECOND)
+        self.lcd_info = self.INFO_FORMAT % (temperature, remaining_days)
         self.display_azure_connection_status()
 
     def display_azure_connection_status(self):
-        try:
-            # Prosty test połączenia wysyłając pusty obiekt do Azure IoT Hub
-            self.azure_iot.send_message({})
-            connection_status = "OK-A"
-        except:
-            connection_status = "NO-A"
-        
+        # Wiadomości są wysyłane w tle, więc status bierzemy z klienta Azure IoT Hub
+        connection_status = self.AZURE_OK if self.azure_iot.is_connected else self.AZURE_NO
+
         # Wyświetl status połączenia
-        self.lcd.cursor_pos = (0, 12)
-        self.lcd.write_string(connection_status)
+        self.clear_row_buffer()
+        self.write_row_buffer(0, self.lcd_info, self.LCD_INFO_WIDTH)
+        self.write_row_buffer(self.LCD_STATUS_COLUMN, connection_status, self.LCD_COLS - self.LCD_STATUS_COLUMN)
+        self.render_row_buffer(0)
+
+    def render_row(self, row_idx, text):
+        """
+        Writes text as a whole LCD row.
+        :param row_idx: LCD row number.
+        :param text: ASCII bytes to display, padded or truncated to the LCD width.
+        """
+        self.clear_row_buffer()
+        self.write_row_buffer(0, text, self.LCD_COLS)
+        self.render_row_buffer(row_idx)
 
+    def render_row_buffer(self, row_idx):
+        """
+        Writes the part of the row buffer that changed since the last render in a single I2C transaction,
+        bypassing RPLCD's per-character transfers.
+        :param row_idx: LCD row number.
+        """
+        cols = self.LCD_COLS
+        row = self.lcd_row_buffer
+        cached = self.lcd_row_cache[row_idx]
+        first = 0
+        while first < cols and row[first] == cached[first]:
+            first += 1
+        if first == cols:
+            return
+        last = cols - 1
+        while row[last] == cached[last]:
+            last -= 1
+        data_nibbles = self.lcd_data_nibbles
+        payload = self.lcd_command_nibbles[0x80 | (self.LCD_ROW_ADDRESSES[row_idx] + first)]
+        payload += b''.join([data_nibbles[char] for char in row[first:last + 1]])
+        self.lcd_bus.i2c_rdwr(i2c_msg.write(self.LCD_I2C_ADDRESS, payload))
+        cached[first:last + 1] = row[first:last + 1]
+
+    def clear_row_buffer(self):
+        self.lcd_row_buffer[:] = self.LCD_BLANK_ROW
+
+    def write_row_buffer(self, column, text, width):
+        """
+        Copies text into the reusable row buffer instead of allocating a padded copy.
+        :param column: First column to write.
+        :param text: ASCII bytes, truncated to width.
+        :param width: Number of columns available for text.
+        """
+        length = min(len(text), width)
+        self.lcd_row_buffer[column:column + length] = text[:length]
+
+    def pack_nibbles(self, value, mode):
+        """
+        Packs one byte as two 4-bit transfers, each latched by an enable pulse.
+        Used once per byte value to build the lookup tables for render_row.
+        :param value: Character or command byte.
+        :param mode: PCF8574_RS for data, 0 for commands.
+        :return: 4 bytes to send to the PCF8574.
+        """
+        mode |= self.PCF8574_BACKLIGHT
+        high = (value & 0xF0) | mode
+        low = ((value << 4) & 0xF0) | mode
+        return bytes((high | self.PCF8574_ENABLE, high, low | self.PCF8574_ENABLE, low))
 
     def activate_relay(self):
         self.relay.on()
+        self.relay_active = True
         self.set_relay_end_time()
         self.display_blending_started_on_lcd()
 
     def set_relay_end_time(self):
-        self.relay_end_time = datetime.now() + timedelta(minutes=self.RELAY_DURATION_MINUTES)
+        self.relay_end_time = self.schedule(self.EVENT_RELAY_END, self.RELAY_DURATION_MINUTES * 60)
 
     def display_blending_started_on_lcd(self):
-        self.lcd.cursor_pos = (1, 0)
-        self.lcd.write_string('Mieszanie: --:--'.ljust(16))
+        self.render_row(1, self.BLEND_STARTED)
 
     def deactivate_relay(self):
         self.relay.off()
+        self.relay_active = False
         self.set_next_relay_activation_time()
 
     def set_next_relay_activation_time(self):
-        self.next_relay_activation = datetime.now() + timedelta(hours=self.MIXTURE_INTERVAL_HOURS)
+        self.next_relay_activation = self.schedule(self.EVENT_RELAY_START, self.MIXTURE_INTERVAL_HOURS * 3600)
 
     def update_relay_timer(self):
-        self.lcd.cursor_pos = (1, 0)
-        remaining = (self.relay_end_time if self.relay.value else self.next_relay_activation) - datetime.now()
-        self.display_time_on_lcd(remaining, self.relay.value)
+        self.set_next_second_update_time()
+        relay_on = self.relay_active
+        remaining_ns = (self.relay_end_time if relay_on else self.next_relay_activation) - time.monotonic_ns()
+        remaining_seconds = max(0, remaining_ns // self.NS_PER_SECOND)
+        self.display_time_on_lcd(remaining_seconds, relay_on)
 
-    def display_time_on_lcd(self, remaining, relay_active):
+    def set_next_second_update_time(self):
+        self.next_second_update = self.schedule(self.EVENT_SECOND_UPDATE, 1)
+
+    def display_time_on_lcd(self, remaining_seconds, relay_active):
         if relay_active:
-            self.lcd.write_string(f'Blend: {int(remaining.total_seconds() / 60)}:{int(remaining.total_seconds() % 60):02d}'.ljust(16))
+            minutes, seconds = divmod(remaining_seconds, 60)
+            self.render_row(1, self.BLEND_FORMAT % (minutes, self.TWO_DIGITS[seconds]))
         else:
-            self.lcd.write_string(f'Next: {int(remaining.total_seconds() / 3600)}:{int(remaining.total_seconds() % 3600 / 60):02d}:{int(remaining.total_seconds() % 60):02d}'.ljust(16))
+            hours, rest = divmod(remaining_seconds, 3600)
+            minutes, seconds = divmod(rest, 60)
+            self.render_row(1, self.NEXT_FORMAT % (hours, self.TWO_DIGITS[minutes], self.TWO_DIGITS[seconds]))
 
     def run(self):
         self.display_azure_connection_status()
-        while datetime.now() < self.end_maceration_time:
-            current_time = datetime.now()
-
-            if current_time >= self.next_temp_update:
-                self.update_temperature()
-
-            if self.relay.value == 1 and current_time >= self.relay_end_time:
-                self.deactivate_relay()
-            elif self.relay.value == 0 and current_time >= self.next_relay_activation:
-                self.activate_relay()
-
-            if current_time >= self.next_second_update:
-                self.update_relay_timer()
-                self.next_second_update = current_time + timedelta(seconds=1)
-
-            next_event_time = min(self.next_temp_update, self.next_second_update, self.relay_end_time if self.relay.value else self.next_relay_activation)
-            time.sleep(max(0, (next_event_time - current_time).total_seconds()))
+        while True:
+            event, sleep_ns = self.scheduler.next_event(time.monotonic_ns())
+            if sleep_ns > 0:
+                self.sleep_ns(sleep_ns)
+            elif event == self.EVENT_MACERATION_END:
+                break
+            else:
+                self.event_handlers[event]()
 
         self.lcd.clear()
         self.lcd.write_string("Zakonczono proces")
@@ -186,11 +376,18 @@ if __name__ == "__main__":
     # Configure logger to not store logs locally.
     logging.basicConfig(stream=logging.NullHandler())
 
+    azure_iot = None
     try:
-        config_file_path = "config.json"
-        macerator = WineMacerator(config_file_path)
+        azure_iot = AzureIoTConnect("config.json")
+        macerator = WineMacerator(azure_iot)
         macerator.run()
     except Exception as e:
         error_message = f"An error occurred: {e}"
-        # Log error message to Azure IoT Hub.
-        AzureIoTConnect(config_file_path).send_message({"error": error_message})
+        if azure_iot is not None:
+            # Log error message to Azure IoT Hub.
+            azure_iot.send_message({"error": error_message})
+        else:
+            print(error_message, file=sys.stderr)
+    finally:
+        if azure_iot is not None:
+            azure_iot.shutdown()
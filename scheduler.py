@@ -0,0 +1,46 @@
+from typing import List, Tuple
+
+
+# Pure integer code with type annotations, so it can be compiled with `mypyc scheduler.py`
+# and still runs unchanged as plain Python when it is not.
+class Scheduler:
+    """ Keeps one deadline per event and picks the event that is due next """
+
+    NOT_SCHEDULED = -1
+
+    def __init__(self, event_count: int) -> None:
+        """
+        Initializes scheduler with no events scheduled.
+        :param event_count: Number of event identifiers, numbered from 0.
+        """
+        self.deadlines: List[int] = [self.NOT_SCHEDULED] * event_count
+
+    def schedule(self, event: int, deadline_ns: int) -> None:
+        """
+        Schedules an event, replacing its previous deadline.
+        :param event: Event identifier.
+        :param deadline_ns: time.monotonic_ns() value at which the event is due.
+        """
+        self.deadlines[event] = deadline_ns
+
+    def next_event(self, now_ns: int) -> Tuple[int, int]:
+        """
+        Finds the earliest scheduled event, lower identifiers first on equal deadlines.
+        An event that is already due is removed from the schedule.
+        :param now_ns: Current time.monotonic_ns() value.
+        :return: Event identifier and nanoseconds to wait until it is due,
+                 or (NOT_SCHEDULED, 0) when no event is scheduled.
+        """
+        next_event = self.NOT_SCHEDULED
+        next_deadline = 0
+        for event in range(len(self.deadlines)):
+            deadline = self.deadlines[event]
+            if deadline != self.NOT_SCHEDULED and (next_event == self.NOT_SCHEDULED or deadline < next_deadline):
+                next_event = event
+                next_deadline = deadline
+        if next_event == self.NOT_SCHEDULED:
+            return self.NOT_SCHEDULED, 0
+        if next_deadline <= now_ns:
+            self.deadlines[next_event] = self.NOT_SCHEDULED
+            return next_event, 0
+        return next_event, next_deadline - now_ns